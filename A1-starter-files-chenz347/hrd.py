@@ -1,5 +1,4 @@
-import copy
-from heapq import heappush, heappop
+from array import array
 import argparse
 from typing import Optional
 
@@ -8,12 +7,148 @@ from typing import Optional
 char_goal = '1'
 char_single = '2'
 
+# The board is 4 x 5, so every cell fits in one bit of an int: cell (x, y) is bit y * 4 + x.
+BOARD_WIDTH = 4
+BOARD_HEIGHT = 5
+BOARD_MASK = (1 << (BOARD_WIDTH * BOARD_HEIGHT)) - 1
+
+# The goal piece has to end up with its top left corner at (GOAL_X, GOAL_Y);
+# GOAL_MASK is the set of cells it covers there.
+GOAL_X = 1
+GOAL_Y = 3
+GOAL_MASK = 0b110011 << (GOAL_Y * BOARD_WIDTH + GOAL_X)
+
+# Piece type ids, used to index the key tables.
+TYPE_GOAL = 0
+TYPE_SINGLE = 1
+TYPE_HORIZONTAL = 2
+TYPE_VERTICAL = 3
+
+# CELL_KEY[cell][type] is one bit, 20 bits per type; a board's key is the xor of the keys of its covered cells,
+# i.e. one bitboard per piece type packed into an int. The 1x2 pieces split their bitboard into pieces in only
+# one way, so the key is exact: two boards have the same key only if they are the same board.
+CELL_KEY = [[1 << (type_id * BOARD_WIDTH * BOARD_HEIGHT + cell) for type_id in range(4)]
+            for cell in range(BOARD_WIDTH * BOARD_HEIGHT)]
+
+# PIECE_CELLS[type] lists (dx, dy, symbol) for every cell a piece covers relative to its top left corner,
+# PIECE_SHAPE[type] is the same footprint as a bitboard anchored at cell 0.
+PIECE_CELLS = (((0, 0, char_goal), (1, 0, char_goal), (0, 1, char_goal), (1, 1, char_goal)),
+               ((0, 0, char_single),),
+               ((0, 0, '<'), (1, 0, '>')),
+               ((0, 0, '^'), (0, 1, 'v')))
+PIECE_SHAPE = tuple(sum(1 << (dy * BOARD_WIDTH + dx) for dx, dy, _ in cells) for cells in PIECE_CELLS)
+# PIECE_PAINT[type] lists (cell offset, symbol byte) pairs for painting a piece into a Board.grid.
+PIECE_PAINT = tuple(tuple((dy * BOARD_WIDTH + dx, ord(ch)) for dx, dy, ch in cells) for cells in PIECE_CELLS)
+EMPTY_CELL = ord('.')
+
+
+# MIRROR_CELL[cell] is the cell's image when the board is flipped left to right.
+MIRROR_CELL = tuple(y * BOARD_WIDTH + BOARD_WIDTH - 1 - x for y in range(BOARD_HEIGHT) for x in range(BOARD_WIDTH))
+
+
+def _piece_key(type_id: int, cell: int, cell_map=range(BOARD_WIDTH * BOARD_HEIGHT)) -> int:
+    """ Xor of the cell keys of a piece of the given type anchored at cell (0 if it does not fit).
+
+    Each covered cell c contributes the key of cell_map[c], so passing MIRROR_CELL gives the
+    keys the piece has on the mirrored board.
+    """
+    x, y = cell % BOARD_WIDTH, cell // BOARD_WIDTH
+    key = 0
+    for dx, dy, _ in PIECE_CELLS[type_id]:
+        if x + dx >= BOARD_WIDTH or y + dy >= BOARD_HEIGHT:
+            return 0
+        key ^= CELL_KEY[cell_map[(y + dy) * BOARD_WIDTH + x + dx]][type_id]
+    return key
+
+
+# PIECE_KEY[type][cell], so moving a piece updates the board key with two lookups.
+# PIECE_MIRROR_KEY is the same for the key of the mirrored board.
+PIECE_KEY = tuple(tuple(_piece_key(type_id, cell) for cell in range(BOARD_WIDTH * BOARD_HEIGHT))
+                      for type_id in range(4))
+PIECE_MIRROR_KEY = tuple(tuple(_piece_key(type_id, cell, MIRROR_CELL)
+                                   for cell in range(BOARD_WIDTH * BOARD_HEIGHT))
+                             for type_id in range(4))
+
+# CELL_XY[cell] is the (x, y) coordinate of a bit index.
+CELL_XY = tuple((cell % BOARD_WIDTH, cell // BOARD_WIDTH) for cell in range(BOARD_WIDTH * BOARD_HEIGHT))
+
+# GOAL_DISTANCE[cell] is the Manhattan distance to the goal position of a goal piece anchored at cell.
+GOAL_DISTANCE = tuple(abs(x - GOAL_X) + abs(y - GOAL_Y) for x, y in CELL_XY)
+
+# Move directions as (dx, dy): up, left, right, down. DIRECTION_SHIFT is the change of bit index.
+DIRECTIONS = ((0, -1), (-1, 0), (1, 0), (0, 1))
+DIRECTION_SHIFT = tuple(dy * BOARD_WIDTH + dx for dx, dy in DIRECTIONS)
+
+
+def _move_tables(type_id: int, direction: int) -> tuple:
+    """ Return (valid anchors, entered offsets) for moving a piece of the given type in the given direction.
+
+    The first item is the bitboard of anchor cells from which the piece stays on the board,
+    the second the offsets (relative to the anchor) of the cells the move newly covers.
+    """
+    dx, dy = DIRECTIONS[direction]
+    cells = [(cx, cy) for cx, cy, _ in PIECE_CELLS[type_id]]
+    valid = 0
+    for cell in range(BOARD_WIDTH * BOARD_HEIGHT):
+        x, y = cell % BOARD_WIDTH, cell // BOARD_WIDTH
+        if all(0 <= x + cx + dx < BOARD_WIDTH and 0 <= y + cy + dy < BOARD_HEIGHT and
+               x + cx < BOARD_WIDTH and y + cy < BOARD_HEIGHT for cx, cy in cells):
+            valid |= 1 << cell
+    entered = tuple((cy + dy) * BOARD_WIDTH + cx + dx for cx, cy in cells if (cx + dx, cy + dy) not in cells)
+    return valid, entered
+
+
+# MOVE_TABLES[type][direction], see _move_tables.
+MOVE_TABLES = tuple(tuple(_move_tables(type_id, direction) for direction in range(4)) for type_id in range(4))
+
+
+def _candidate_moves(empty: int) -> tuple:
+    """ Return every move the given empty cells allow, whichever pieces are on the board.
+
+    Each candidate is (packed move, type, anchor bit); it is a legal move exactly when a piece
+    of that type is anchored at that bit. Moves are packed as anchor_cell << 4 | type << 2 | direction.
+    """
+    candidates = []
+    for type_id in range(4):
+        for direction in range(4):
+            valid, entered = MOVE_TABLES[type_id][direction]
+            for cell in range(BOARD_WIDTH * BOARD_HEIGHT):
+                if valid >> cell & 1 and all(empty >> (cell + offset) & 1 for offset in entered):
+                    candidates.append((cell << 4 | type_id << 2 | direction, type_id, 1 << cell))
+    return tuple(candidates)
+
+
+# MOVE_LUT[empty mask] caches _candidate_moves. A puzzle always has two empty cells, so all
+# 190 two-cell masks are filled in up front; any other mask is added the first time it is seen.
+MOVE_LUT = {(1 << a) | (1 << b): _candidate_moves((1 << a) | (1 << b))
+            for a in range(BOARD_WIDTH * BOARD_HEIGHT) for b in range(a + 1, BOARD_WIDTH * BOARD_HEIGHT)}
+
+
+def _move_key_delta(move: int) -> tuple:
+    """ Return the (key, mirrored key) xor deltas of a packed move, 0s if it leaves the board.
+
+    """
+    cell = move >> 4
+    type_id = move >> 2 & 3
+    new_cell = cell + DIRECTION_SHIFT[move & 3]
+    if not 0 <= new_cell < BOARD_WIDTH * BOARD_HEIGHT:
+        return 0, 0
+    return (PIECE_KEY[type_id][cell] ^ PIECE_KEY[type_id][new_cell],
+            PIECE_MIRROR_KEY[type_id][cell] ^ PIECE_MIRROR_KEY[type_id][new_cell])
+
+
+# MOVE_KEY_DELTA[packed move] is what the move xors into Board.key and Board.mkey.
+MOVE_KEY_DELTA = tuple(_move_key_delta(move) for move in range(BOARD_WIDTH * BOARD_HEIGHT << 4))
+
 
 class Piece:
     """
     This represents a piece on the Hua Rong Dao puzzle.
     """
 
+    # No per-instance __dict__: pieces and states are created for every search node.
+    __slots__ = ('is_goal', 'is_single', 'coord_x', 'coord_y', 'orientation')
+
     def __init__(self, is_goal, is_single, coord_x, coord_y, orientation: Optional[str]):
         """
         :param is_goal: True if the piece is the goal piece and False otherwise.
@@ -35,6 +170,24 @@ class Piece:
         self.coord_y = coord_y
         self.orientation = orientation
 
+    def type_id(self):
+        """ Return the piece type id (TYPE_GOAL, TYPE_SINGLE, TYPE_HORIZONTAL or TYPE_VERTICAL).
+
+        """
+        if self.is_goal:
+            return TYPE_GOAL
+        if self.is_single:
+            return TYPE_SINGLE
+        if self.orientation == 'h':
+            return TYPE_HORIZONTAL
+        return TYPE_VERTICAL
+
+    def clone(self, dx=0, dy=0):
+        """ Return a copy of the piece, slid by (dx, dy).
+
+        """
+        return Piece(self.is_goal, self.is_single, self.coord_x + dx, self.coord_y + dy, self.orientation)
+
     def __repr__(self):
         return '{} {} {} {} {}'.format(self.is_goal, self.is_single, self.coord_x, self.coord_y, self.orientation)
 
@@ -47,6 +200,10 @@ class Board:
     Board class for setting up the playing board.
     """
 
+    # The A* tables keep one Board per generated node.
+    __slots__ = ('width', 'height', 'pieces', 'cell_piece', 'grid', 'bb_goal', 'bb_single', 'bb_hh', 'bb_vv',
+                 'an_hh', 'an_vv', 'key', 'mkey')
+
     def __init__(self, pieces: list[Piece]):
         """
         :param pieces: The list of Pieces
@@ -57,52 +214,146 @@ class Board:
         self.height = 5
 
         self.pieces = pieces
-        # self.grid is a 2-d (size * size) array automatically generated
+        # cell_piece[cell] is the index in pieces of the piece whose top left corner is at cell, or -1.
+        self.cell_piece = array('b', [-1]) * (BOARD_WIDTH * BOARD_HEIGHT)
+        for i, p in enumerate(pieces):
+            self.cell_piece[p.coord_y * BOARD_WIDTH + p.coord_x] = i
+        # self.grid is a flat bytearray (cell (x, y) at y * width + x) automatically generated
         # using the information on the pieces when a board is being created.
         # A grid contains the symbol for representing the pieces on the board.
-        self.grid = []
+        self.grid = bytearray()
+        # One bitboard per piece type, each bit set means the cell is covered by a piece of that type.
+        self.bb_goal = 0
+        self.bb_single = 0
+        self.bb_hh = 0
+        self.bb_vv = 0
+        # Top left cells of the 1x2 pieces, so gen_children and MOVE_LUT can test each piece's anchor with one &.
+        self.an_hh = 0
+        self.an_vv = 0
+        # Exact key of the board, see CELL_KEY.
+        self.key = 0
+        # Key of the board flipped left to right.
+        self.mkey = 0
         self.__construct_grid()
 
     def __hash__(self):
-        return hash(frozenset(self.pieces))
+        return self.key
+
+    def canonical_key(self):
+        """
+        Return the same exact key for the board and its left-right mirror image.
+
+        The puzzle is symmetric (the goal position is centred), so a board and its mirror
+        need the same number of moves and only one of them has to be searched.
+        """
+        return min(self.key, self.mkey)
+
+    def __eq__(self, other):
+        return self.key == other.key
 
     def __construct_grid(self):
         """
-        Called in __init__ to set up a 2-d grid based on the piece location information.
+        Called in __init__ to set up a flat grid based on the piece location information.
 
         """
 
-        for i in range(self.height):
-            line = []
-            for j in range(self.width):
-                line.append('.')
-            self.grid.append(line)
+        self.grid = bytearray([EMPTY_CELL]) * (self.width * self.height)
 
         for piece in self.pieces:
+            cell = piece.coord_y * BOARD_WIDTH + piece.coord_x
+            for offset, code in PIECE_PAINT[piece.type_id()]:
+                self.grid[cell + offset] = code
+            bit = 1 << cell
             if piece.is_goal:
-                self.grid[piece.coord_y][piece.coord_x] = char_goal
-                self.grid[piece.coord_y][piece.coord_x + 1] = char_goal
-                self.grid[piece.coord_y + 1][piece.coord_x] = char_goal
-                self.grid[piece.coord_y + 1][piece.coord_x + 1] = char_goal
+                self.bb_goal |= bit * 0b110011
             elif piece.is_single:
-                self.grid[piece.coord_y][piece.coord_x] = char_single
+                self.bb_single |= bit
             else:
                 if piece.orientation == 'h':
-                    self.grid[piece.coord_y][piece.coord_x] = '<'
-                    self.grid[piece.coord_y][piece.coord_x + 1] = '>'
+                    self.bb_hh |= bit * 0b11
+                    self.an_hh |= bit
                 elif piece.orientation == 'v':
-                    self.grid[piece.coord_y][piece.coord_x] = '^'
-                    self.grid[piece.coord_y + 1][piece.coord_x] = 'v'
+                    self.bb_vv |= bit * 0b10001
+                    self.an_vv |= bit
+            self.key ^= PIECE_KEY[piece.type_id()][piece.coord_y * BOARD_WIDTH + piece.coord_x]
+            self.mkey ^= PIECE_MIRROR_KEY[piece.type_id()][piece.coord_y * BOARD_WIDTH + piece.coord_x]
+
+    def make_move(self, index: int, dx: int, dy: int):
+        """
+        Slide self.pieces[index] by (dx, dy) in place, updating the grid, bitboards and
+        key only for the cells that change. Undo with undo_move.
+
+        Pieces are never mutated: the moved piece is replaced by a new Piece, so copies
+        made with copy() can share Piece objects with this board.
+        """
+        piece = self.pieces[index]
+        type_id = piece.type_id()
+        moved = piece.clone(dx, dy)
+        self.pieces[index] = moved
+
+        old_cell = piece.coord_y * BOARD_WIDTH + piece.coord_x
+        new_cell = moved.coord_y * BOARD_WIDTH + moved.coord_x
+        for offset, code in PIECE_PAINT[type_id]:
+            self.grid[old_cell + offset] = EMPTY_CELL
+        for offset, code in PIECE_PAINT[type_id]:
+            self.grid[new_cell + offset] = code
+        self.cell_piece[old_cell] = -1
+        self.cell_piece[new_cell] = index
+        delta = (PIECE_SHAPE[type_id] << old_cell) ^ (PIECE_SHAPE[type_id] << new_cell)
+        if type_id == TYPE_GOAL:
+            self.bb_goal ^= delta
+        elif type_id == TYPE_SINGLE:
+            self.bb_single ^= delta
+        elif type_id == TYPE_HORIZONTAL:
+            self.bb_hh ^= delta
+            self.an_hh ^= (1 << old_cell) ^ (1 << new_cell)
+        else:
+            self.bb_vv ^= delta
+            self.an_vv ^= (1 << old_cell) ^ (1 << new_cell)
+        self.key ^= PIECE_KEY[type_id][old_cell] ^ PIECE_KEY[type_id][new_cell]
+        self.mkey ^= PIECE_MIRROR_KEY[type_id][old_cell] ^ PIECE_MIRROR_KEY[type_id][new_cell]
+
+    def undo_move(self, index: int, dx: int, dy: int):
+        """
+        Revert make_move(index, dx, dy).
+
+        """
+        self.make_move(index, -dx, -dy)
+
+    def copy(self):
+        """
+        Return a copy of the board without rebuilding the grid from the pieces.
+
+        """
+        board = Board.__new__(Board)
+        board.width = self.width
+        board.height = self.height
+        board.pieces = self.pieces[:]
+        board.cell_piece = self.cell_piece[:]
+        board.grid = self.grid[:]
+        board.bb_goal = self.bb_goal
+        board.bb_single = self.bb_single
+        board.bb_hh = self.bb_hh
+        board.bb_vv = self.bb_vv
+        board.an_hh = self.an_hh
+        board.an_vv = self.an_vv
+        board.key = self.key
+        board.mkey = self.mkey
+        return board
+
+    def text(self):
+        """
+        Return the board as text, one line per row, each ending in a newline.
+
+        """
+        return ''.join(self.grid[y * self.width:(y + 1) * self.width].decode() + '\n' for y in range(self.height))
 
     def display(self):
         """
         Print out the current board.
 
         """
-        for i, line in enumerate(self.grid):
-            for ch in line:
-                print(ch, end='')
-            print()
+        print(self.text(), end='')
 
 
 class State:
@@ -113,6 +364,8 @@ class State:
     heuristic function, f value, current depth and parent.
     """
 
+    __slots__ = ('board', 'f', 'depth', 'parent', 'id')
+
     def __init__(self, board, f, depth, parent=None):
         """
         :param board: The board of the state.
@@ -131,12 +384,25 @@ class State:
         self.id = hash(board)  # The id for breaking ties.
 
     def __lt__(self, other):
-        return self.f < other.f
+        # ties on f are broken by id, so heapq never falls back to comparing other fields
+        return (self.f, self.id) < (other.f, other.id)
 
     def __eq__(self, other):
-        if self.id == other.id:
-            return True
-        return False
+        if not isinstance(other, State):
+            return NotImplemented
+        return self.id == other.id
+
+
+def find_all(line: str, ch: str) -> list[int]:
+    """ Return every index of ch in line, using str.find so the scan itself runs in C.
+
+    """
+    found = []
+    x = line.find(ch)
+    while x != -1:
+        found.append(x)
+        x = line.find(ch, x + 1)
+    return found
 
 
 def read_from_file(filename):
@@ -149,28 +415,23 @@ def read_from_file(filename):
     :rtype: Board
     """
 
-    puzzle_file = open(filename, "r")
+    with open(filename, "r") as puzzle_file:
+        lines = puzzle_file.read().splitlines()
 
-    line_index = 0
     pieces = []
     g_found = False
-    for line in puzzle_file:
-
-        for x, ch in enumerate(line):
-
-            if ch == '^':  # found vertical piece
-                pieces.append(Piece(False, False, x, line_index, 'v'))
-            elif ch == '<':  # found horizontal piece
-                pieces.append(Piece(False, False, x, line_index, 'h'))
-            elif ch == char_single:
-                pieces.append(Piece(False, True, x, line_index, None))
-            elif ch == char_goal:
-                if g_found is False:
-                    pieces.append(Piece(True, False, x, line_index, None))
-                    g_found = True
-        line_index += 1
-
-    puzzle_file.close()
+    for y, line in enumerate(lines):
+        for x in find_all(line, '^'):  # found vertical piece
+            pieces.append(Piece(False, False, x, y, 'v'))
+        for x in find_all(line, '<'):  # found horizontal piece
+            pieces.append(Piece(False, False, x, y, 'h'))
+        for x in find_all(line, char_single):
+            pieces.append(Piece(False, True, x, y, None))
+        if g_found is False:
+            x = line.find(char_goal)
+            if x != -1:
+                pieces.append(Piece(True, False, x, y, None))
+                g_found = True
 
     board = Board(pieces)
 
@@ -181,14 +442,41 @@ def write_solution(goal_state: State, filename: str):
     """ Generate solution file base on the goal state.
 
     """
-    f = open(filename, "w+")
     sol = get_solution(goal_state)
-    for s in sol:
-        for i, line in enumerate(s.board.grid):
-            for ch in line:
-                f.write(ch)
-            f.write('\n')
-        f.write("\n")
+    with open(filename, "w+") as f:
+        f.write(''.join(s.board.text() + '\n' for s in sol))
+
+
+##########################################
+# Bitboard Kernels
+# These only take and return ints, so they stay free of Piece/Board objects.
+##########################################
+
+def empty_mask(bb_all: int) -> int:
+    """ Return the bitboard of empty cells given the bitboard of all covered cells.
+
+    """
+    return ~bb_all & BOARD_MASK
+
+
+def gen_children(bb_goal: int, bb_single: int, bb_hh: int, bb_vv: int, an_hh: int, an_vv: int,
+                 key: int, mkey: int) -> list[tuple]:
+    """ Return (packed move, canonical key of the resulting board) for every legal move.
+
+    The child keys come straight from MOVE_KEY_DELTA, so a search can batch all
+    children of a node and probe its tables before making any move on a Board.
+    """
+    empty = empty_mask(bb_goal | bb_single | bb_hh | bb_vv)
+    candidates = MOVE_LUT.get(empty)
+    if candidates is None:
+        candidates = MOVE_LUT[empty] = _candidate_moves(empty)
+    anchors = (bb_goal & -bb_goal, bb_single, an_hh, an_vv)
+    children = []
+    for move, type_id, bit in candidates:
+        if anchors[type_id] & bit:
+            delta, mdelta = MOVE_KEY_DELTA[move]
+            children.append((move, min(key ^ delta, mkey ^ mdelta)))
+    return children
 
 
 ##########################################
@@ -198,307 +486,195 @@ def write_solution(goal_state: State, filename: str):
 def goal_test(curr_state: State):
     """ Test whether the given state is a goal state.
 
+    The goal piece always covers exactly four cells, so its bitboard equals GOAL_MASK
+    only when it sits on the goal position. The searches inline this comparison.
     """
-    if curr_state.board.grid[3][1] == char_goal and curr_state.board.grid[4][2] == char_goal:
-        return True
-    return False
+    return curr_state.board.bb_goal == GOAL_MASK
 
 
-def find_empty_spot(curr_board: Board):
-    """ Return the coordinates of the two empty spots on the board.
+def find_piece(curr_board: Board, x: int, y: int) -> int:
+    """ Return the index of the piece whose top left corner is at (x, y).
 
     """
-    empty_spots = []
-    for y in range(0, 5):
-        for x in range(0, 4):
-            if curr_board.grid[y][x] == '.':
-                empty_spots.append([x, y])
-    return empty_spots
+    return curr_board.cell_piece[y * BOARD_WIDTH + x]
 
 
-def check_spot_valid(spot: list):
-    """ Check if given coordinate a valid spot on the chess board.
+def board_move(curr_board: Board, move: int) -> tuple:
+    """ Turn a move packed by gen_children into a (piece index, dx, dy) tuple for the board
 
     """
-    if 3 >= spot[0] >= 0:
-        if 4 >= spot[1] >= 0:
-            return True
-    return False
+    x, y = CELL_XY[move >> 4]
+    dx, dy = DIRECTIONS[move & 3]
+    return find_piece(curr_board, x, y), dx, dy
 
 
-def add_to_successor(new_pieces: list[Piece], curr, successor: list, m_curr: int):
-    """
+def expand(board: Board) -> list[tuple]:
+    """ Return (packed move, canonical key of the child) for every child of the board, see gen_children
 
     """
-    new_board = Board(new_pieces)
-    new_state = State(new_board, 0, curr.depth + 1, curr)
-    new_f = 1 + curr.f - m_curr + manhattan_distance(new_state)
-    new_state.f = new_f
-    heappush(successor, new_state)
-
-
-def check_upper(empty_coord1_x, empty_coord1_y, empty_coord2_x, empty_coord2_y, curr_board, spot, curr_state, successor,
-                is_2: bool, m_curr):
-    if check_spot_valid(spot):
-        # goal above empty
-        if curr_board.grid[spot[1]][spot[0]] == char_goal and not is_2:
-            if check_spot_valid([spot[0] + 1, spot[1]]):
-                if curr_board.grid[spot[1]][spot[0] + 1] == char_goal and empty_coord1_x + 1 == empty_coord2_x \
-                        and empty_coord2_y == empty_coord1_y:
-                    new_pieces = copy.deepcopy(curr_board.pieces)
-                    for p in new_pieces:
-                        if p.is_goal:
-                            p.coord_y = p.coord_y + 1
-                    add_to_successor(new_pieces, curr_state, successor, m_curr)
-        # horizontal above empty
-        if curr_board.grid[spot[1]][spot[0]] == '<' and not is_2:
-            if check_spot_valid([spot[0] + 1, spot[1]]):
-                if curr_board.grid[spot[1]][spot[0] + 1] == '>' and empty_coord1_x + 1 == empty_coord2_x \
-                        and empty_coord2_y == empty_coord1_y:
-                    new_pieces = copy.deepcopy(curr_board.pieces)
-                    for p in new_pieces:
-                        if p.coord_x == spot[0] and p.coord_y == spot[1]:
-                            p.coord_y = p.coord_y + 1
-                    add_to_successor(new_pieces, curr_state, successor, m_curr)
-        # vertical above empty
-        if curr_board.grid[spot[1]][spot[0]] == 'v':
-            new_pieces = copy.deepcopy(curr_board.pieces)
-            for p in new_pieces:
-                if p.coord_x == spot[0] and p.coord_y == spot[1] - 1:
-                    p.coord_y = p.coord_y + 1
-            add_to_successor(new_pieces, curr_state, successor, m_curr)
-        # single above empty
-        if curr_board.grid[spot[1]][spot[0]] == char_single:
-            new_pieces = copy.deepcopy(curr_board.pieces)
-            for p in new_pieces:
-                if p.coord_x == spot[0] and p.coord_y == spot[1]:
-                    p.coord_y = p.coord_y + 1
-            add_to_successor(new_pieces, curr_state, successor, m_curr)
-
-    return
-
-
-def check_left(empty_coord1_x, empty_coord1_y, empty_coord2_x, empty_coord2_y, curr_board, spot, curr_state, successor,
-               is_2: bool, m_curr):
-    if check_spot_valid(spot):
-        # goal left empty
-        if curr_board.grid[spot[1]][spot[0]] == char_goal and not is_2:
-            if check_spot_valid([spot[0], spot[1] + 1]):
-                if curr_board.grid[spot[1] + 1][spot[0]] == char_goal and empty_coord1_x == empty_coord2_x \
-                        and empty_coord1_y + 1 == empty_coord2_y:
-                    new_pieces = copy.deepcopy(curr_board.pieces)
-                    for p in new_pieces:
-                        if p.is_goal:
-                            p.coord_x = p.coord_x + 1
-                    add_to_successor(new_pieces, curr_state, successor, m_curr)
-        # horizontal left empty
-        if curr_board.grid[spot[1]][spot[0]] == '>':
-            new_pieces = copy.deepcopy(curr_board.pieces)
-            for p in new_pieces:
-                if p.coord_x == spot[0] - 1 and p.coord_y == spot[1]:
-                    p.coord_x = p.coord_x + 1
-            add_to_successor(new_pieces, curr_state, successor, m_curr)
-        # vertical left empty
-        if curr_board.grid[spot[1]][spot[0]] == '^' and not is_2:
-            if check_spot_valid([spot[0], spot[1] + 1]):
-                if curr_board.grid[spot[1] + 1][spot[0]] == 'v' and empty_coord1_x == empty_coord2_x \
-                        and empty_coord1_y + 1 == empty_coord2_y:
-                    new_pieces = copy.deepcopy(curr_board.pieces)
-                    for p in new_pieces:
-                        if p.coord_x == spot[0] and p.coord_y == spot[1]:
-                            p.coord_x = p.coord_x + 1
-                    add_to_successor(new_pieces, curr_state, successor, m_curr)
-        # single left empty
-        if curr_board.grid[spot[1]][spot[0]] == char_single:
-            new_pieces = copy.deepcopy(curr_board.pieces)
-            for p in new_pieces:
-                if p.coord_x == spot[0] and p.coord_y == spot[1]:
-                    p.coord_x = p.coord_x + 1
-            add_to_successor(new_pieces, curr_state, successor, m_curr)
-    return
-
-
-def check_right(empty_coord1_x, empty_coord1_y, empty_coord2_x, empty_coord2_y, curr_board, spot, curr_state, successor,
-                is_2: bool, m_curr):
-    if check_spot_valid(spot):
-        # goal right empty
-        if curr_board.grid[spot[1]][spot[0]] == char_goal and not is_2:
-            if check_spot_valid([spot[0], spot[1] + 1]):
-                if curr_board.grid[spot[1] + 1][spot[0]] == char_goal and empty_coord1_x == empty_coord2_x \
-                        and empty_coord1_y + 1 == empty_coord2_y:
-                    new_pieces = copy.deepcopy(curr_board.pieces)
-                    for p in new_pieces:
-                        if p.is_goal:
-                            p.coord_x = p.coord_x - 1
-                    add_to_successor(new_pieces, curr_state, successor, m_curr)
-        # horizontal right empty
-        if curr_board.grid[spot[1]][spot[0]] == '<':
-            new_pieces = copy.deepcopy(curr_board.pieces)
-            for p in new_pieces:
-                if p.coord_x == spot[0] and p.coord_y == spot[1]:
-                    p.coord_x = p.coord_x - 1
-            add_to_successor(new_pieces, curr_state, successor, m_curr)
-        # vertical right empty
-        if curr_board.grid[spot[1]][spot[0]] == '^' and not is_2:
-            if check_spot_valid([spot[0], spot[1] + 1]):
-                if curr_board.grid[spot[1] + 1][spot[0]] == 'v' and empty_coord1_x == empty_coord2_x \
-                        and empty_coord1_y + 1 == empty_coord2_y:
-                    new_pieces = copy.deepcopy(curr_board.pieces)
-                    for p in new_pieces:
-                        if p.coord_x == spot[0] and p.coord_y == spot[1]:
-                            p.coord_x = p.coord_x - 1
-                    add_to_successor(new_pieces, curr_state, successor, m_curr)
-        # single right empty
-        if curr_board.grid[spot[1]][spot[0]] == char_single:
-            new_pieces = copy.deepcopy(curr_board.pieces)
-            for p in new_pieces:
-                if p.coord_x == spot[0] and p.coord_y == spot[1]:
-                    p.coord_x = p.coord_x - 1
-            add_to_successor(new_pieces, curr_state, successor, m_curr)
-    return
-
-
-def check_bottom(empty_coord1_x, empty_coord1_y, empty_coord2_x, empty_coord2_y, curr_board, spot, curr_state,
-                 successor, is_2: bool, m_curr):
-    if check_spot_valid(spot):
-        # goal under empty
-        if curr_board.grid[spot[1]][spot[0]] == char_goal and not is_2:
-            if check_spot_valid([spot[0] + 1, spot[1]]):
-                if curr_board.grid[spot[1]][spot[0] + 1] == char_goal and empty_coord1_x + 1 == empty_coord2_x \
-                        and empty_coord2_y == empty_coord1_y:
-                    new_pieces = copy.deepcopy(curr_board.pieces)
-                    for p in new_pieces:
-                        if p.is_goal:
-                            p.coord_y = p.coord_y - 1
-                    add_to_successor(new_pieces, curr_state, successor, m_curr)
-        # horizontal under empty
-        if curr_board.grid[spot[1]][spot[0]] == '<' and not is_2:
-            if check_spot_valid([spot[0] + 1, spot[1]]):
-                if curr_board.grid[spot[1]][spot[0] + 1] == '>' and empty_coord1_x + 1 == empty_coord2_x \
-                        and empty_coord2_y == empty_coord1_y:
-                    new_pieces = copy.deepcopy(curr_board.pieces)
-                    for p in new_pieces:
-                        if p.coord_x == spot[0] and p.coord_y == spot[1]:
-                            p.coord_y = p.coord_y - 1
-                    add_to_successor(new_pieces, curr_state, successor, m_curr)
-        # vertical under empty
-        if curr_board.grid[spot[1]][spot[0]] == '^':
-            new_pieces = copy.deepcopy(curr_board.pieces)
-            for p in new_pieces:
-                if p.coord_x == spot[0] and p.coord_y == spot[1]:
-                    p.coord_y = p.coord_y - 1
-            add_to_successor(new_pieces, curr_state, successor, m_curr)
-        # single under empty
-        if curr_board.grid[spot[1]][spot[0]] == char_single:
-            new_pieces = copy.deepcopy(curr_board.pieces)
-            for p in new_pieces:
-                if p.coord_x == spot[0] and p.coord_y == spot[1]:
-                    p.coord_y = p.coord_y - 1
-            add_to_successor(new_pieces, curr_state, successor, m_curr)
-
-    return
-
-
-def generate_successors(curr: State, empty: list[list], successor: list):
-    """ Generate successors of the given state and put into successor list
-
-    with given list of empty spots
-    """
-    curr_board = curr.board
-
-    empty_coord1_x, empty_coord1_y = empty[0][0], empty[0][1]
-    empty_coord2_x, empty_coord2_y = empty[1][0], empty[1][1]
-
-    spot1_0 = [empty_coord1_x, empty_coord1_y - 1]
-    spot1_1 = [empty_coord1_x - 1, empty_coord1_y]
-    spot1_2 = [empty_coord1_x + 1, empty_coord1_y]
-    spot1_3 = [empty_coord1_x, empty_coord1_y + 1]
-
-    spot2_0 = [empty_coord2_x, empty_coord2_y - 1]
-    spot2_1 = [empty_coord2_x - 1, empty_coord2_y]
-    spot2_2 = [empty_coord2_x + 1, empty_coord2_y]
-    spot2_3 = [empty_coord2_x, empty_coord2_y + 1]
-
-    m_curr = manhattan_distance(curr)
-    check_upper(empty_coord1_x, empty_coord1_y, empty_coord2_x, empty_coord2_y,
-                curr_board, spot1_0, curr, successor, False, m_curr)
-    check_upper(empty_coord1_x, empty_coord1_y, empty_coord2_x, empty_coord2_y,
-                curr_board, spot2_0, curr, successor, True, m_curr)
-    check_left(empty_coord1_x, empty_coord1_y, empty_coord2_x, empty_coord2_y,
-               curr_board, spot1_1, curr, successor, False, m_curr)
-    check_left(empty_coord1_x, empty_coord1_y, empty_coord2_x, empty_coord2_y,
-               curr_board, spot2_1, curr, successor, True, m_curr)
-    check_right(empty_coord1_x, empty_coord1_y, empty_coord2_x, empty_coord2_y,
-                curr_board, spot1_2, curr, successor, False, m_curr)
-    check_right(empty_coord1_x, empty_coord1_y, empty_coord2_x, empty_coord2_y,
-                curr_board, spot2_2, curr, successor, True, m_curr)
-    check_bottom(empty_coord1_x, empty_coord1_y, empty_coord2_x, empty_coord2_y,
-                 curr_board, spot1_3, curr, successor, False, m_curr)
-    check_bottom(empty_coord1_x, empty_coord1_y, empty_coord2_x, empty_coord2_y,
-                 curr_board, spot2_3, curr, successor, True, m_curr)
-
-    return
+    return gen_children(board.bb_goal, board.bb_single, board.bb_hh, board.bb_vv, board.an_hh, board.an_vv,
+                        board.key, board.mkey)
 
 
 def get_solution(goal_state: State) -> list[State]:
     """ Given the goal state and back track to solution
 
     """
-    sol = [goal_state]
-    while goal_state.parent is not None:
-        sol.append(goal_state.parent)
+    # the depth gives the length of the solution, so it is filled in back to front
+    sol = [goal_state] * (goal_state.depth + 1)
+    for i in range(goal_state.depth, -1, -1):
+        sol[i] = goal_state
         goal_state = goal_state.parent
-    sol.reverse()
     return sol
 
 
+def encode_move(index: int, dx: int, dy: int) -> int:
+    """ Pack a (piece index, dx, dy) move into one int
+
+    """
+    return index << 4 | (dx + 1) << 2 | (dy + 1)
+
+
+def decode_move(move: int) -> tuple:
+    """ Unpack a move made by encode_move
+
+    """
+    return move >> 4, (move >> 2 & 3) - 1, (move & 3) - 1
+
+
+def replay_moves(init_state: State, moves) -> State:
+    """ Apply the encoded moves to the initial state and return the last state,
+
+    with the parent chain filled in
+    """
+    board = init_state.board.copy()
+    curr = init_state
+    for move in moves:
+        board.make_move(*decode_move(move))
+        curr = State(board.copy(), 0, curr.depth + 1, curr)
+    return curr
+
+
 def dfs_search(init_state: State) -> Optional[State]:
     """ Dfs search to find the goal state
 
+    The search walks a single board with make/undo moves, so no State is created per node.
+    stack holds the encoded moves still to try and depths the depth each of them leads to;
+    path holds the moves applied to the board so far, which is also the solution once the
+    goal is reached.
     """
-    frontier = [init_state]
+    board = init_state.board.copy()
+    stack = array('q', [-1])  # -1 stands for "no move", i.e. the initial board
+    depths = array('i', [0])
+    path = []
     explored = set()
-    while len(frontier) != 0:
-        curr = frontier.pop()
-        if curr.id not in explored:
-            explored.add(curr.id)
-            if goal_test(curr):
-                return curr
-            empty_spots = find_empty_spot(curr.board)
-            generate_successors(curr, empty_spots, frontier)
+    visited = {board.canonical_key(): 0}
+    while len(stack) != 0:
+        move = stack.pop()
+        depth = depths.pop()
+        # backtrack to the parent of the state the move leads to
+        while len(path) >= depth > 0:
+            board.undo_move(*decode_move(path.pop()))
+        if move != -1:
+            board.make_move(*decode_move(move))
+            path.append(move)
+        key = board.canonical_key()
+        if key in explored:
+            continue
+        explored.add(key)
+        if board.bb_goal == GOAL_MASK:
+            return replay_moves(init_state, path)
+        for move, key in expand(board):
+            if visited.get(key, depth + 2) > depth + 1:
+                visited[key] = depth + 1
+                stack.append(encode_move(*board_move(board, move)))
+                depths.append(depth + 1)
     print("Should not reach here")
     return None
 
 
 def manhattan_distance(curr_state: State) -> int:
-    """ Calculate Manhattan distance for the given state
+    """ Calculate Manhattan distance of the goal piece for the given state
 
+    See heuristic.
     """
-    goal_x = 1
-    goal_y = 3
-    if goal_test(curr_state):
-        return 0
-    for p in curr_state.board.pieces:
-        if p.is_goal:
-            return abs(p.coord_x - goal_x) + abs(p.coord_y - goal_y)
+    return heuristic(curr_state.board)
+
+
+def heuristic(board: Board) -> int:
+    """ Calculate Manhattan distance of the goal piece for the given board
+
+    One is added when another piece sits on a cell of the goal position, since
+    that piece has to move out of the way at least once. Moving the goal piece
+    only ever frees or fills empty cells there, so the heuristic stays consistent.
+    """
+    h = GOAL_DISTANCE[(board.bb_goal & -board.bb_goal).bit_length() - 1]
+    if (board.bb_single | board.bb_hh | board.bb_vv) & GOAL_MASK:
+        h += 1
+    return h
 
 
 def a_star_search(init_state: State) -> Optional[State]:
     """ A* search to find the goal state
 
+    Search nodes are indices into parallel tables: boards[i] is the board of node i (dropped
+    once the node is expanded), parents[i] its parent node, moves[i] the encoded move that
+    led to it and depths[i] its depth. The solution is rebuilt from the moves at the end,
+    so no State is created per node.
+
+    The frontier (OPEN) is a bucket queue: buckets[f] lists the nodes pushed with that f,
+    and f_min is the lowest f that may still have nodes. f is a small int and, as the
+    heuristic is consistent, never drops below f_min, so push and pop are O(1) list
+    operations. Ties within a bucket pop last in first out, i.e. deepest first.
+    best_g maps each canonical board key to the smallest depth it has been pushed with, and
+    closed holds the keys of the boards already expanded. A node is never removed from
+    the frontier when a shorter path to its board turns up; the stale entry is skipped when
+    popped. The heuristic is consistent, so a closed board is never reopened.
     """
-    frontier = []
-    init_state.f = manhattan_distance(init_state)
-    heappush(frontier, init_state)
-    explored = set()
-    while len(frontier) != 0:
-        curr = heappop(frontier)
-        if curr.id not in explored:
-            explored.add(curr.id)
-            if goal_test(curr):
-                return curr
-            empty_spots = find_empty_spot(curr.board)
-            generate_successors(curr, empty_spots, frontier)
+    boards = [init_state.board.copy()]
+    parents = array('i', [-1])
+    moves = array('H', [0])
+    depths = array('i', [0])
+    f_min = manhattan_distance(init_state)
+    buckets = [[] for _ in range(f_min)] + [[0]]
+    size = 1
+    best_g = {init_state.board.canonical_key(): 0}
+    closed = set()
+    while size != 0:
+        while not buckets[f_min]:
+            f_min += 1
+        node = buckets[f_min].pop()
+        size -= 1
+        board = boards[node]
+        depth = depths[node]
+        key = board.canonical_key()
+        if key in closed:
+            continue
+        closed.add(key)
+        if board.bb_goal == GOAL_MASK:
+            path = []
+            while parents[node] != -1:
+                path.append(moves[node])
+                node = parents[node]
+            path.reverse()
+            return replay_moves(init_state, path)
+        # probe best_g for all children first; only the new ones are made on a board
+        for move, key in expand(board):
+            if key not in closed and best_g.get(key, depth + 2) > depth + 1:
+                best_g[key] = depth + 1
+                index, dx, dy = board_move(board, move)
+                child = board.copy()
+                child.make_move(index, dx, dy)
+                boards.append(child)
+                parents.append(node)
+                moves.append(encode_move(index, dx, dy))
+                depths.append(depth + 1)
+                f = depth + 1 + heuristic(child)
+                while len(buckets) <= f:
+                    buckets.append([])
+                buckets[f].append(len(boards) - 1)
+                size += 1
+        boards[node] = None
     print("Should not reach here")
     return None
 
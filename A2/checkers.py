@@ -1,8 +1,6 @@
-import copy
 import math
-from heapq import heappush, heappop
+import random
 import argparse
-import time
 
 # ====================================================================================
 
@@ -10,15 +8,81 @@ char_red_king = 'R'
 char_red_normal = 'r'
 char_black_king = 'B'
 char_black_normal = 'b'
+# (is_king, is_red) of the piece each symbol stands for.
+CHAR_TO_PIECE = {char_red_normal: (False, True), char_red_king: (True, True),
+                 char_black_normal: (False, False), char_black_king: (True, False)}
+# PIECE_CHAR[is_king][is_red] is the symbol of a piece as a byte, the inverse of CHAR_TO_PIECE.
+PIECE_CHAR = ((ord(char_black_normal), ord(char_red_normal)), (ord(char_black_king), ord(char_red_king)))
+# Transposition table: maps transposition_key() of a state, i.e. the board and the side to move, to
+# (depth searched below it, value, flag); the flag says whether the value is exact or only a bound.
+# An entry is only used for a search that needs to go no deeper than it did.
 explored_dict = dict()
+EXACT = 0
+LOWER = 1  # the search failed high, the true value is at least the stored one
+UPPER = 2  # the search failed low, the true value is at most the stored one
 DEPTH_LIMIT = 9
 
+# The board is 8 x 8, so every square fits in one bit of an int: square (x, y) is bit y * 8 + x.
+BOARD_SIZE = 8
+BOARD_MASK = (1 << (BOARD_SIZE * BOARD_SIZE)) - 1
+
+# Diagonal directions as (dx, dy); moves and jumps are generated in this order.
+# Red men move up the board (the first two), black men down (the last two).
+DIRECTIONS = ((-1, -1), (1, -1), (-1, 1), (1, 1))
+
+
+def _step_table(dx: int, dy: int) -> tuple:
+    """ Return, for every square, the square one step away in direction (dx, dy), or None if that is off the board.
+
+    """
+    table = []
+    for square in range(BOARD_SIZE * BOARD_SIZE):
+        x, y = square % BOARD_SIZE, square // BOARD_SIZE
+        if 0 <= x + dx < BOARD_SIZE and 0 <= y + dy < BOARD_SIZE:
+            table.append((y + dy) * BOARD_SIZE + x + dx)
+        else:
+            table.append(None)
+    return tuple(table)
+
+
+def _jump_table(dx: int, dy: int) -> tuple:
+    """ Return, for every square, (jumped square, landing square) of a jump in direction (dx, dy).
+
+    The entry is None when the landing square is off the board.
+    """
+    table = []
+    for square in range(BOARD_SIZE * BOARD_SIZE):
+        x, y = square % BOARD_SIZE, square // BOARD_SIZE
+        if 0 <= x + 2 * dx < BOARD_SIZE and 0 <= y + 2 * dy < BOARD_SIZE:
+            table.append(((y + dy) * BOARD_SIZE + x + dx, (y + 2 * dy) * BOARD_SIZE + x + 2 * dx))
+        else:
+            table.append(None)
+    return tuple(table)
+
+
+# ZOBRIST[square][kind] is a random 64-bit key, kind being 0 red man, 1 red king, 2 black man, 3 black king;
+# a board hashes to the xor of the keys of its pieces. A fixed seed keeps runs reproducible.
+_zobrist_rng = random.Random(384)
+ZOBRIST = [[_zobrist_rng.getrandbits(64) for _ in range(4)] for _ in range(BOARD_SIZE * BOARD_SIZE)]
+
+# STEP_TABLES[direction][square] and JUMP_TABLES[direction][square], see _step_table and _jump_table.
+STEP_TABLES = tuple(_step_table(dx, dy) for dx, dy in DIRECTIONS)
+JUMP_TABLES = tuple(_jump_table(dx, dy) for dx, dy in DIRECTIONS)
+# JUMP_SHIFT[direction] is the change of bit index of one step, JUMP_FROM[direction] the bitboard of
+# the squares a jump in that direction can start from.
+JUMP_SHIFT = tuple(dy * BOARD_SIZE + dx for dx, dy in DIRECTIONS)
+JUMP_FROM = tuple(sum(1 << square for square, squares in enumerate(table) if squares is not None)
+                  for table in JUMP_TABLES)
+
 
 class Piece:
     """
     This represents a piece on the checker.
     """
 
+    # No per-instance __dict__: pieces, boards and states are created for every search node.
+    __slots__ = ('is_king', 'is_red', 'coord_x', 'coord_y')
+
     def __init__(self, is_king, is_red, coord_x, coord_y):
         """
         :param is_king: True if the piece is the king piece and False otherwise.
@@ -44,63 +108,131 @@ class Piece:
         return hash(self) == hash(other)
 
 
+# PIECES[is_king][is_red][square] is the one shared Piece of that kind on that square; pieces are never
+# changed once created, so boards use these instead of making new ones for every move.
+PIECES = tuple(tuple(tuple(Piece(is_king, is_red, square % BOARD_SIZE, square // BOARD_SIZE)
+                           for square in range(BOARD_SIZE * BOARD_SIZE))
+                     for is_red in (False, True))
+               for is_king in (False, True))
+
+
 class Board:
     """
     Board class for setting up the playing board.
     """
 
-    def __init__(self, pieces: list[Piece]):
+    __slots__ = ('width', 'height', 'pieces', 'red_pieces', 'black_pieces', 'grid', 'red_men', 'red_kings',
+                 'black_men', 'black_kings', 'zkey')
+
+    def __init__(self, pieces: list[Piece], parent=None, changed=()):
         """
         :param pieces: The list of Pieces
         :type pieces: List[Piece]
+        :param parent: A board the pieces differ from only by the changed pieces, or None.
+        :type parent: Board
+        :param changed: The pieces that are on exactly one of parent and this board.
+        :type changed: Iterable[Piece]
         """
 
         self.width = 8
         self.height = 8
 
         self.pieces = pieces
-        # self.grid is a 2-d (size * size) array automatically generated
-        # using the information on the pieces when a board is being created.
+        # The pieces of each side, in the order of pieces.
+        self.red_pieces = [p for p in pieces if p.is_red]
+        self.black_pieces = [p for p in pieces if not p.is_red]
+        # self.grid is a flat bytearray (square (x, y) at y * width + x) generated from the
+        # pieces the first time the board is printed; the search itself only uses the bitboards.
         # A grid contains the symbol for representing the pieces on the board.
-        self.grid = []
-        self.__construct_grid()
+        self.grid = None
+        # One bitboard per kind of piece, each bit set means the square holds a piece of that kind.
+        self.red_men = 0
+        self.red_kings = 0
+        self.black_men = 0
+        self.black_kings = 0
+        # Zobrist hash of the board, see ZOBRIST.
+        self.zkey = 0
+        if parent is None:
+            changed = pieces
+        else:
+            # a move only changes a few pieces, so start from the parent's bitboards and hash
+            self.red_men, self.red_kings = parent.red_men, parent.red_kings
+            self.black_men, self.black_kings = parent.black_men, parent.black_kings
+            self.zkey = parent.zkey
+        for piece in changed:
+            self.__toggle(piece)
 
     def __hash__(self):
-        return hash(frozenset(self.pieces))
+        return self.zkey
+
+    def __eq__(self, other):
+        return (self.red_men, self.red_kings, self.black_men, self.black_kings) == \
+            (other.red_men, other.red_kings, other.black_men, other.black_kings)
+
+    def red(self):
+        """ Return the bitboard of all red pieces.
+
+        """
+        return self.red_men | self.red_kings
+
+    def black(self):
+        """ Return the bitboard of all black pieces.
+
+        """
+        return self.black_men | self.black_kings
+
+    def occupied(self):
+        """ Return the bitboard of all occupied squares.
+
+        """
+        return self.red_men | self.red_kings | self.black_men | self.black_kings
+
+    def __toggle(self, piece: Piece):
+        """
+        Called in __init__ to add the piece to, or remove it from, the bitboards and hash.
+
+        """
+
+        square = piece.coord_y * BOARD_SIZE + piece.coord_x
+        bit = 1 << square
+        kind = (0 if piece.is_red else 2) + (1 if piece.is_king else 0)
+        self.zkey ^= ZOBRIST[square][kind]
+        if piece.is_red:
+            if piece.is_king:
+                self.red_kings ^= bit
+            else:
+                self.red_men ^= bit
+        elif piece.is_king:
+            self.black_kings ^= bit
+        else:
+            self.black_men ^= bit
 
     def __construct_grid(self):
         """
-        Called in __init__ to set up a 2-d grid based on the piece location information.
+        Called by text() to set up a flat grid based on the piece location information.
 
         """
 
-        for i in range(self.height):
-            line = []
-            for j in range(self.width):
-                line.append('.')
-            self.grid.append(line)
+        self.grid = bytearray(b'.') * (self.width * self.height)
 
         for piece in self.pieces:
-            if piece.is_king and piece.is_red:
-                self.grid[piece.coord_y][piece.coord_x] = char_red_king
-            elif piece.is_king and not piece.is_red:
-                self.grid[piece.coord_y][piece.coord_x] = char_black_king
-            elif not piece.is_king and piece.is_red:
-                self.grid[piece.coord_y][piece.coord_x] = char_red_normal
-            elif not piece.is_king and not piece.is_red:
-                self.grid[piece.coord_y][piece.coord_x] = char_black_normal
-            else:
-                print("Can't reach here")
+            self.grid[piece.coord_y * BOARD_SIZE + piece.coord_x] = PIECE_CHAR[piece.is_king][piece.is_red]
+
+    def text(self):
+        """
+        Return the board as text, one line per row, each ending in a newline.
+
+        """
+        if self.grid is None:
+            self.__construct_grid()
+        return ''.join(self.grid[y * self.width:(y + 1) * self.width].decode() + '\n' for y in range(self.height))
 
     def display(self):
         """
         Print out the current board.
 
         """
-        for i, line in enumerate(self.grid):
-            for ch in line:
-                print(ch, end='')
-            print()
+        print(self.text(), end='')
 
 
 class State:
@@ -111,6 +243,8 @@ class State:
     heuristic function, f value, current depth and parent.
     """
 
+    __slots__ = ('children', 'v', 'board', 'utility', 'depth', 'parent', 'alpha', 'beta', 'red_turn', 'id')
+
     def __init__(self, board, utility, depth, alpha, beta, is_red_turn, children, v, parent=None):
         """
         :param board: The board of the state.
@@ -150,10 +284,12 @@ class State:
     def __gt__(self, other):
         return self.utility > other.utility
 
+    def __hash__(self):
+        return self.id
+
     def __eq__(self, other):
-        if self.id == other.id:
-            return True
-        return False
+        # the id is only a hash, so equal ids are confirmed on the boards
+        return self.id == other.id and self.board == other.board
 
     def add_children(self, child):
         self.children.append(child)
@@ -169,25 +305,15 @@ def read_from_file(filename):
     :rtype: Board
     """
 
-    puzzle_file = open(filename, "r")
+    with open(filename, "r") as puzzle_file:
+        lines = puzzle_file.read().splitlines()
 
-    line_index = 0
     pieces = []
-    for line in puzzle_file:
-
+    for y, line in enumerate(lines):
         for x, ch in enumerate(line):
-
-            if ch == char_red_normal:
-                pieces.append(Piece(False, True, x, line_index))
-            elif ch == char_red_king:
-                pieces.append(Piece(True, True, x, line_index))
-            elif ch == char_black_normal:
-                pieces.append(Piece(False, False, x, line_index))
-            elif ch == char_black_king:
-                pieces.append(Piece(True, False, x, line_index))
-        line_index += 1
-
-    puzzle_file.close()
+            kind = CHAR_TO_PIECE.get(ch)
+            if kind is not None:
+                pieces.append(PIECES[kind[0]][kind[1]][y * BOARD_SIZE + x])
 
     board = Board(pieces)
 
@@ -198,14 +324,9 @@ def write_solution(goal_state: State, filename: str):
     """ Generate solution file base on the goal state.
 
     """
-    f = open(filename, "w+")
     sol = get_solution(goal_state)
-    for s in sol:
-        for i, line in enumerate(s.board.grid):
-            for ch in line:
-                f.write(ch)
-            f.write('\n')
-        f.write("\n")
+    with open(filename, "w+") as f:
+        f.write(''.join(s.board.text() + '\n' for s in sol))
 
 
 ##########################################
@@ -220,14 +341,14 @@ def terminal_test(curr_state: State):
     generate_successors(curr_state, s_list)
     if curr_state.red_turn:
         # all red pieces
-        if all(p.is_red for p in curr_state.board.pieces):
+        if not curr_state.board.black():
             return ['T', 'r']
             # no more moves
         elif len(s_list) == 0:
             return ['T', 'b']
     else:
         # all black pieces
-        if all(not p.is_red for p in curr_state.board.pieces):
+        if not curr_state.board.red():
             return ['T', 'b']
             # no more moves
         elif len(s_list) == 0:
@@ -279,6 +400,14 @@ def calculate_piece_value(piece: Piece) -> float:
     return ret
 
 
+# PIECE_VALUE[is_red][is_king][square] is calculate_piece_value of such a piece on that square.
+PIECE_VALUE = tuple(tuple(tuple(calculate_piece_value(Piece(is_king, is_red, square % BOARD_SIZE,
+                                                            square // BOARD_SIZE))
+                                for square in range(BOARD_SIZE * BOARD_SIZE))
+                          for is_king in (False, True))
+                    for is_red in (False, True))
+
+
 def calculate_estimate_utility(curr_state: State) -> float:
     """ Calculate estimated utility for a non-terminal state
 
@@ -286,83 +415,70 @@ def calculate_estimate_utility(curr_state: State) -> float:
 
     point = 0
     for p in curr_state.board.pieces:
-        point += calculate_piece_value(p)
+        point += PIECE_VALUE[p.is_red][p.is_king][p.coord_y * BOARD_SIZE + p.coord_x]
     return point
 
 
-def find_empty_spot(curr_board: Board):
-    """ Return the coordinates of the empty spots on the board.
+def find_piece(curr_board: Board, square: int) -> Piece:
+    """ Return the piece on the given square, or None if it is empty.
 
     """
-    empty_spots = []
-    for y in range(0, 8):
-        for x in range(0, 8):
-            if curr_board.grid[y][x] == '.':
-                empty_spots.append([x, y])
-    return empty_spots
+    bit = 1 << square
+    if not curr_board.occupied() & bit:
+        return None
+    # pieces are interned, so the kind on the square is enough to name the piece
+    is_king = bool((curr_board.red_kings | curr_board.black_kings) & bit)
+    return PIECES[is_king][bool(curr_board.red() & bit)][square]
 
 
-def check_boundaries(spot: list):
-    """ Check if given coordinate a valid spot on the chess board.
+def piece_captures(curr: State, p: Piece) -> list[Piece]:
+    """ Return the pieces p can capture, in DIRECTIONS order.
 
     """
-    if 7 >= spot[0] >= 0:
-        if 7 >= spot[1] >= 0:
-            return True
-    return False
-
-
-def check_spot_valid(curr: State, spot: list):
-    """ Check if the given spot has a piece on it
+    captures = []
+    enemy = curr.board.black() if p.is_red else curr.board.red()
+    occupied = curr.board.occupied()
+    square = p.coord_y * BOARD_SIZE + p.coord_x
+    for direction, table in enumerate(JUMP_TABLES):
+        # men only jump forward
+        if not p.is_king and (direction < 2) != p.is_red:
+            continue
+        squares = table[square]
+        if squares is not None and enemy >> squares[0] & 1 and not occupied >> squares[1] & 1:
+            captures.append(find_piece(curr.board, squares[0]))
+    return captures
+
+
+def upgrade(piece: Piece) -> Piece:
+    """ Return the given piece, upgraded to a king if it reached the other side
 
     """
-    for p in curr.board.pieces:
-        if p.coord_x == spot[0] and p.coord_y == spot[1]:
-            return False
-    return True
 
+    if not piece.is_king and piece.coord_y == (0 if piece.is_red else 7):
+        return PIECES[True][piece.is_red][piece.coord_y * BOARD_SIZE + piece.coord_x]
+    return piece
 
-def check_neighbor_color(curr: State, is_red: bool, spot: list) -> list:
-    """ Check if the neighboring spot has a different color
 
-    """
-    if is_red:
-        for p in curr.board.pieces:
-            if not p.is_red:
-                if p.coord_x == spot[0] and p.coord_y == spot[1]:
-                    return [True, p]
-        return [False]
-    else:
-        for p in curr.board.pieces:
-            if p.is_red:
-                if p.coord_x == spot[0] and p.coord_y == spot[1]:
-                    return [True, p]
-        return [False]
-
-
-def generate_possible_spots(p: Piece) -> list[list]:
-    """ generate all possible spots of move around a piece
+def any_jump(curr_board: Board, red_turn: bool) -> bool:
+    """ Return whether the side to move has any jump, with a few shifts per direction.
 
     """
-    spot_1 = [p.coord_x - 1, p.coord_y - 1]
-    spot_2 = [p.coord_x + 1, p.coord_y - 1]
-    spot_3 = [p.coord_x - 1, p.coord_y + 1]
-    spot_4 = [p.coord_x + 1, p.coord_y + 1]
-    spots = [spot_1, spot_2, spot_3, spot_4]
-    return spots
-
-
-def upgrade(piece: Piece):
-    """ upgrade the given piece
-
-    """
-
-    if piece.is_red:
-        if piece.coord_y == 0:
-            piece.is_king = True
+    if red_turn:
+        men, kings, enemy = curr_board.red_men, curr_board.red_kings, curr_board.black()
     else:
-        if piece.coord_y == 7:
-            piece.is_king = True
+        men, kings, enemy = curr_board.black_men, curr_board.black_kings, curr_board.red()
+    empty = ~curr_board.occupied() & BOARD_MASK
+    for direction in range(4):
+        # men only jump forward
+        movers = (kings | men if (direction < 2) == red_turn else kings) & JUMP_FROM[direction]
+        shift = JUMP_SHIFT[direction]
+        if shift > 0:
+            landing = ((movers << shift & enemy) << shift) & empty
+        else:
+            landing = ((movers >> -shift & enemy) >> -shift) & empty
+        if landing:
+            return True
+    return False
 
 
 def check_jump(curr: State, prev_jump=None) -> dict[Piece: list[list]]:
@@ -373,130 +489,57 @@ def check_jump(curr: State, prev_jump=None) -> dict[Piece: list[list]]:
     :return: a dictionary maps to piece and its jump locations (as a list).
     """
     jump_map = dict()
-    empty_spots = find_empty_spot(curr.board)
     # there is a previous jump (multi jumps)
     if prev_jump is not None:
-        p = prev_jump
-        if p.is_red:
-            spots = generate_possible_spots(p)
-            for s in spots:
-                if check_boundaries(s):
-                    # black neighbor
-                    n_list = check_neighbor_color(curr, True, s)
-                    if n_list[0]:
-                        if p.is_king:
-                            # top left
-                            if [2 * s[0] - p.coord_x, 2 * s[1] - p.coord_y] in empty_spots:
-                                if jump_map.setdefault(p) is None:
-                                    jump_map[p] = []
-                                jump_map[p].append(n_list[1])
-                        else:
-                            # top left
-                            if 2 * s[1] - p.coord_y < p.coord_y:
-                                if [2 * s[0] - p.coord_x, 2 * s[1] - p.coord_y] in empty_spots:
-                                    if jump_map.setdefault(p) is None:
-                                        jump_map[p] = []
-                                    jump_map[p].append(n_list[1])
-        else:
-            spots = generate_possible_spots(p)
-            for s in spots:
-                if check_boundaries(s):
-                    # red neighbor
-                    n_list = check_neighbor_color(curr, False, s)
-                    if n_list[0]:
-                        if p.is_king:
-                            # top left
-                            if [2 * s[0] - p.coord_x, 2 * s[1] - p.coord_y] in empty_spots:
-                                if jump_map.setdefault(p) is None:
-                                    jump_map[p] = []
-                                jump_map[p].append(n_list[1])
-                        else:
-                            # top left
-                            if 2 * s[1] - p.coord_y > p.coord_y:
-                                if [2 * s[0] - p.coord_x, 2 * s[1] - p.coord_y] in empty_spots:
-                                    if jump_map.setdefault(p) is None:
-                                        jump_map[p] = []
-                                    jump_map[p].append(n_list[1])
+        captures = piece_captures(curr, prev_jump)
+        if captures:
+            jump_map[prev_jump] = captures
         return jump_map
-    if curr.red_turn:
-        for p in curr.board.pieces:
-            # red pieces
-            if p.is_red:
-                spots = generate_possible_spots(p)
-                for s in spots:
-                    if check_boundaries(s):
-                        # black neighbor
-                        n_list = check_neighbor_color(curr, True, s)
-                        if n_list[0]:
-                            if p.is_king:
-                                # top left
-                                if [2 * s[0] - p.coord_x, 2 * s[1] - p.coord_y] in empty_spots:
-                                    if jump_map.setdefault(p) is None:
-                                        jump_map[p] = []
-                                    jump_map[p].append(n_list[1])
-                            else:
-                                # top left
-                                if 2 * s[1] - p.coord_y < p.coord_y:
-                                    if [2 * s[0] - p.coord_x, 2 * s[1] - p.coord_y] in empty_spots:
-                                        if jump_map.setdefault(p) is None:
-                                            jump_map[p] = []
-                                        jump_map[p].append(n_list[1])
-    else:
-        for p in curr.board.pieces:
-            # black pieces
-            if not p.is_red:
-                spots = generate_possible_spots(p)
-                for s in spots:
-                    if check_boundaries(s):
-                        # red neighbor
-                        n_list = check_neighbor_color(curr, False, s)
-                        if n_list[0]:
-                            if p.is_king:
-                                # top left
-                                if [2 * s[0] - p.coord_x, 2 * s[1] - p.coord_y] in empty_spots:
-                                    if jump_map.setdefault(p) is None:
-                                        jump_map[p] = []
-                                    jump_map[p].append(n_list[1])
-                            else:
-                                # top left
-                                if 2 * s[1] - p.coord_y > p.coord_y:
-                                    if [2 * s[0] - p.coord_x, 2 * s[1] - p.coord_y] in empty_spots:
-                                        if jump_map.setdefault(p) is None:
-                                            jump_map[p] = []
-                                        jump_map[p].append(n_list[1])
+    if not any_jump(curr.board, curr.red_turn):
+        return jump_map
+    for p in curr.board.red_pieces if curr.red_turn else curr.board.black_pieces:
+        captures = piece_captures(curr, p)
+        if captures:
+            jump_map[p] = captures
     return jump_map
 
 
-def jump(curr, piece: Piece) -> list[State]:
+def jump(curr, piece: Piece, index: int) -> list[State]:
     """ Perform jump
 
+    index is where piece is in curr.board.pieces.
     """
     flag_state = curr
-    jump_map = check_jump(flag_state, piece)
-    if len(jump_map) == 0:
+    captures = piece_captures(flag_state, piece)
+    if len(captures) == 0:
         return [flag_state]
     else:
         ret = []
-        for capture in jump_map[piece]:
-            new_pieces = copy.deepcopy(flag_state.board.pieces)
-            for p in new_pieces:
-                if p == piece:
-                    # update new position
-                    p.coord_x = 2 * capture.coord_x - p.coord_x
-                    p.coord_y = 2 * capture.coord_y - p.coord_y
-                    upgrade(p)
-                    # remove captured piece
-                    new_pieces.remove(capture)
-                    new_state = State(Board(new_pieces), 0, 0, 0, 0, curr.red_turn, [], 0,
-                                      flag_state)
-                    # update flag, for recursion
-                    flag_state = new_state
-                    j_states = jump(flag_state, p)
-                    for js in j_states:
-                        ret.append(js)
-                        # set back flag for next iteration
-                    flag_state = curr
-                    break
+        pieces = flag_state.board.pieces
+        # where the piece on each square is in pieces, so captured pieces are taken out by index
+        position = {q.coord_y * BOARD_SIZE + q.coord_x: i for i, q in enumerate(pieces)}
+        square = piece.coord_y * BOARD_SIZE + piece.coord_x
+        for capture in captures:
+            # pieces are never changed once on a board, so the new board shares all but the jumping one
+            new_pieces = pieces[:]
+            capture_square = capture.coord_y * BOARD_SIZE + capture.coord_x
+            capture_index = position[capture_square]
+            # update new position, the landing square is as far past the capture as the piece is before it
+            landing = 2 * capture_square - square
+            p = upgrade(PIECES[piece.is_king][piece.is_red][landing])
+            new_pieces[index] = p
+            # remove captured piece
+            del new_pieces[capture_index]
+            new_board = Board(new_pieces, flag_state.board, (piece, p, capture))
+            new_state = State(new_board, 0, 0, 0, 0, curr.red_turn, [], 0, flag_state)
+            # update flag, for recursion
+            flag_state = new_state
+            # the jumping piece moved up one place if the captured piece was before it
+            j_states = jump(flag_state, p, index - (capture_index < index))
+            for js in j_states:
+                ret.append(js)
+            # set back flag for next iteration
+            flag_state = curr
         for s in ret:
             s.depth = curr.depth + 1
             s.red_turn = not curr.red_turn
@@ -509,61 +552,25 @@ def move(curr: State) -> list[State]:
 
     """
     ret = []
-    if curr.red_turn:
-        for p in curr.board.pieces:
-            temp = curr
-            if p.is_red:
-                spots = generate_possible_spots(p)
-                count = 1
-                for s in spots:
-                    if check_boundaries(s) and check_spot_valid(temp, s):
-                        new_piece = copy.deepcopy(curr.board.pieces)
-                        for p2 in new_piece:
-                            if p2.coord_x == p.coord_x and p.coord_y == p2.coord_y:
-                                if p2.is_king:
-                                    p2.coord_x = s[0]
-                                    p2.coord_y = s[1]
-                                    temp = State(Board(new_piece), 0, curr.depth + 1, 0, 0, False,
-                                                 [], 0, curr)
-                                    ret.append(temp)
-                                    ret.append(temp)
-                                else:
-                                    # top left
-                                    if count == 1 or count == 2:
-                                        p2.coord_x = s[0]
-                                        p2.coord_y = s[1]
-                                        upgrade(p2)
-                                        temp = State(Board(new_piece), 0, curr.depth + 1, 0, 0,
-                                                     False, [], 0, curr)
-                                        ret.append(temp)
-                    count += 1
-    else:
-        for p in curr.board.pieces:
-            temp = curr
-            if not p.is_red:
-                spots = generate_possible_spots(p)
-                count = 1
-                for s in spots:
-                    if check_boundaries(s) and check_spot_valid(temp, s):
-                        new_piece = copy.deepcopy(curr.board.pieces)
-                        for p2 in new_piece:
-                            if p2.coord_x == p.coord_x and p.coord_y == p2.coord_y:
-                                if p2.is_king:
-                                    p2.coord_x = s[0]
-                                    p2.coord_y = s[1]
-                                    temp = State(Board(new_piece), 0, curr.depth + 1, 0, 0, True,
-                                                 [], 0, curr)
-                                    ret.append(temp)
-                                else:
-                                    # top left
-                                    if count == 3 or count == 4:
-                                        p2.coord_x = s[0]
-                                        p2.coord_y = s[1]
-                                        upgrade(p2)
-                                        temp = State(Board(new_piece), 0, curr.depth + 1, 0, 0,
-                                                     True, [], 0, curr)
-                                        ret.append(temp)
-                    count += 1
+    # occupancy of curr, tested for every target square instead of rescanning the pieces
+    occupied = curr.board.occupied()
+    for index, p in enumerate(curr.board.pieces):
+        if p.is_red != curr.red_turn:
+            continue
+        square = p.coord_y * BOARD_SIZE + p.coord_x
+        for direction, table in enumerate(STEP_TABLES):
+            # men only move forward
+            if not p.is_king and (direction < 2) != p.is_red:
+                continue
+            target = table[square]
+            if target is None or occupied >> target & 1:
+                continue
+            # pieces are never changed once on a board, so the new board shares all but the moved one
+            new_piece = curr.board.pieces[:]
+            p2 = upgrade(PIECES[p.is_king][p.is_red][target])
+            new_piece[index] = p2
+            new_board = Board(new_piece, curr.board, (p, p2))
+            ret.append(State(new_board, 0, curr.depth + 1, 0, 0, not curr.red_turn, [], 0, curr))
     return ret
 
 
@@ -575,8 +582,10 @@ def generate_successors(curr: State, successor: list):
     jump_map = check_jump(curr)
     if len(jump_map) != 0:
         # must jump
-        for piece in jump_map:
-            jumps = jump(curr, piece)
+        for index, piece in enumerate(curr.board.pieces):
+            if piece not in jump_map:
+                continue
+            jumps = jump(curr, piece, index)
             for j in jumps:
                 if j not in curr.children:
                     curr.add_children(j)
@@ -599,6 +608,55 @@ def cut_off_test(curr_state: State) -> bool:
         return False
 
 
+def transposition_key(curr_state: State) -> tuple:
+    """ Return the explored_dict key of the state: its four bitboards and the side to move.
+
+    The key is the exact position rather than the zobrist hash, so two positions never share an entry.
+    """
+    board = curr_state.board
+    return board.red_men, board.red_kings, board.black_men, board.black_kings, curr_state.red_turn
+
+
+def probe_explored(curr_state: State, key: tuple, alpha, beta) -> tuple:
+    """ Narrow the (alpha, beta) window with the explored_dict entry of the state, if it was searched deep enough.
+
+    The entry's value is put in curr_state.v, so the caller can return it as soon as alpha >= beta;
+    an exact value always closes the window.
+    """
+    entry = explored_dict.get(key)
+    if entry is None or entry[0] < DEPTH_LIMIT - curr_state.depth:
+        return alpha, beta
+    _, value, flag = entry
+    if abs(value) >= 10000:
+        # a win is stored relative to its node, see store_explored
+        value -= 10000 * curr_state.depth
+    curr_state.v = value
+    if flag == EXACT:
+        return value, value
+    elif flag == LOWER:
+        return max(alpha, value), beta
+    else:
+        return alpha, min(beta, value)
+
+
+def store_explored(curr_state: State, key: tuple, alpha, beta):
+    """ Cache curr_state.v, searched with the window (alpha, beta), in explored_dict.
+
+    """
+    if curr_state.v <= alpha:
+        flag = UPPER
+    elif curr_state.v >= beta:
+        flag = LOWER
+    else:
+        flag = EXACT
+    value = curr_state.v
+    if abs(value) >= 10000:
+        # the score of a win drops by 10000 per ply it lies below the root (see utility_function), so
+        # store it as if this node were the root; it is then right wherever the board is met again
+        value += 10000 * curr_state.depth
+    explored_dict[key] = (DEPTH_LIMIT - curr_state.depth, value, flag)
+
+
 def alpha_beta_search(curr_state: State) -> State:
     if curr_state.red_turn:
         curr_state.v = max_value(curr_state, -math.inf, math.inf)
@@ -607,7 +665,7 @@ def alpha_beta_search(curr_state: State) -> State:
     for act in curr_state.children:
         if act.v == curr_state.v:
             return act
-    explored_dict.pop(curr_state.id)
+    explored_dict.pop(transposition_key(curr_state))
     curr_state.children = []
     if curr_state.red_turn:
         curr_state.v = max_value(curr_state, -math.inf, math.inf)
@@ -625,9 +683,11 @@ def max_value(curr_state: State, alpha, beta) -> float:
     elif cut_off_test(curr_state):
         curr_state.v = calculate_estimate_utility(curr_state)
         return curr_state.v
-    elif curr_state.id in explored_dict:
-        curr_state.v = explored_dict[curr_state.id]
-        return explored_dict[curr_state.id]
+    key = transposition_key(curr_state)
+    alpha, beta = probe_explored(curr_state, key, alpha, beta)
+    if alpha >= beta:
+        return curr_state.v
+    alpha_orig, beta_orig = alpha, beta
     curr_state.v = -math.inf
     actions = []
     generate_successors(curr_state, actions)
@@ -638,13 +698,15 @@ def max_value(curr_state: State, alpha, beta) -> float:
     curr_state.children.reverse()
     for act in curr_state.children:
         curr_state.v = max(curr_state.v, min_value(act, alpha, beta))
+        # only act.v is needed from here on, so let the searched subtree go
+        act.children = []
         if curr_state.v >= beta:
             # caching states
-            explored_dict[curr_state.id] = curr_state.v
+            store_explored(curr_state, key, alpha_orig, beta_orig)
             return curr_state.v
         alpha = max(alpha, curr_state.v)
     # caching states
-    explored_dict[curr_state.id] = curr_state.v
+    store_explored(curr_state, key, alpha_orig, beta_orig)
     return curr_state.v
 
 
@@ -656,9 +718,11 @@ def min_value(curr_state: State, alpha, beta) -> float:
         # estimate utility if not terminal
         curr_state.v = calculate_estimate_utility(curr_state)
         return curr_state.v
-    elif curr_state.id in explored_dict:
-        curr_state.v = explored_dict[curr_state.id]
-        return explored_dict[curr_state.id]
+    key = transposition_key(curr_state)
+    alpha, beta = probe_explored(curr_state, key, alpha, beta)
+    if alpha >= beta:
+        return curr_state.v
+    alpha_orig, beta_orig = alpha, beta
     curr_state.v = math.inf
     actions = []
     generate_successors(curr_state, actions)
@@ -668,13 +732,15 @@ def min_value(curr_state: State, alpha, beta) -> float:
     curr_state.children.sort()
     for act in curr_state.children:
         curr_state.v = min(curr_state.v, max_value(act, alpha, beta))
+        # only act.v is needed from here on, so let the searched subtree go
+        act.children = []
         if curr_state.v <= alpha:
             # caching states
-            explored_dict[curr_state.id] = curr_state.v
+            store_explored(curr_state, key, alpha_orig, beta_orig)
             return curr_state.v
         beta = min(beta, curr_state.v)
     # caching states
-    explored_dict[curr_state.id] = curr_state.v
+    store_explored(curr_state, key, alpha_orig, beta_orig)
     return curr_state.v
 
 
@@ -684,9 +750,15 @@ def get_solution(init_state: State) -> list[State]:
     """
     iter_s = init_state
     sol = [init_state]
+    # how many times each position, by transposition_key(), has been played
+    played = {transposition_key(init_state): 1}
     while 1:
         next_action = alpha_beta_search(iter_s)
-        if terminal_test(next_action)[0] == 'T':
+        key = transposition_key(next_action)
+        played[key] = played.get(key, 0) + 1
+        # the same position a third time is a draw: two kings cannot force a win against a king that
+        # keeps to the double corner, so without this such a game would go on forever
+        if terminal_test(next_action)[0] == 'T' or played[key] == 3:
             sol.append(next_action)
             break
         sol.append(next_action)
@@ -700,32 +772,24 @@ def get_solution(init_state: State) -> list[State]:
 
 
 if __name__ == "__main__":
-    # parser = argparse.ArgumentParser()
-    # parser.add_argument(
-    #     "--inputfile",
-    #     type=str,
-    #     required=True,
-    #     help="The input file that contains the puzzle."
-    # )
-    # parser.add_argument(
-    #     "--outputfile",
-    #     type=str,
-    #     required=True,
-    #     help="The output file that contains the solution."
-    # )
-    # args = parser.parse_args()
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--inputfile",
+        type=str,
+        required=True,
+        help="The input file that contains the puzzle."
+    )
+    parser.add_argument(
+        "--outputfile",
+        type=str,
+        required=True,
+        help="The output file that contains the solution."
+    )
+    args = parser.parse_args()
 
     # read the board from the file
-    # inboard = read_from_file(args.inputfile)
-    # generate state base on the board
-    inboard = read_from_file('test_successor_red.txt')
-    # start = time.time()
-    #
-    # inboard.display()
+    inboard = read_from_file(args.inputfile)
+    # generate state base on the board, red moves first
     state = State(inboard, 0, 0, -math.inf, math.inf, True, [], 0)
-    write_solution(state, 'test_successor_red_sol.txt')
-    # end = time.time()
-    # print(end - start)
-
-    # write solution base on algo choice
-    # write_solution(state, args.outputfile)
+    # write solution
+    write_solution(state, args.outputfile)